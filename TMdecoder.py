@@ -2,21 +2,52 @@ import struct
 import xmltodict
 import csv
 import io
+import itertools
+import os
 import sys
 import argparse
 import numpy as np
+import xml.etree.ElementTree as ET
 import glob as glob
 from datetime import datetime
 from datetime import timezone
 from sys import exit
+from concurrent.futures import ProcessPoolExecutor
+
+# One LPC data record: 16 high gain bins, 16 low gain bins and 16 housekeeping values
+LPC_RECORD_DTYPE = np.dtype(('>u2', (48,)))
+
+# One RS41 data record, as laid out in the TM binary payload (see RS41msg)
+RS41_SAMPLE_DTYPE = np.dtype([('valid', 'u1'), ('frame', '>i4'), ('tdry', '>u2'), ('hum', '>u2'),
+                              ('tsens', '>u2'), ('pres', '>u2'), ('err', '>u2')])
+
+# CSV column formats, matching the resolution of the decoded values.
+# RS41: valid, unix_time, 4 measurements, module_error, RH and WV.
+RS41_CSV_FMT = ['%d', '%d', '%.2f', '%.2f', '%.2f', '%.2f', '%d', '%.15g', '%.15g']
+
+#LPC bins - each number is the left end of the bins in nm.   The first bin has minimal sensitivity
+LPC_DIAMS = (275,300,325,350,375,400,450,500,550,600,650,700,750,800,900,1000,1200,1400,1600,1800,2000,2500,3000,3500,4000,6000,8000,10000,13000,16000,24000,24000)
+LPC_BIN_HEADER = tuple(str(d) for d in LPC_DIAMS)
+
+# LPC CSV column names and units rows
+LPC_CSV_HEADER = ('Time', 'Pump1_I','Pump2_I','PHA_I', 'PHA_12V','PHA_3V3','CPU_V', 'Input_V', 'Flow',
+                  'Pump1_PWM', 'Pump2_PWM','Pump1_T', 'Pump2_T', 'Laser_T', 'PCB_T', 'Inlet_T') + LPC_BIN_HEADER
+LPC_CSV_UNITS = ('[unix_time]', '[mA]','[mA]','[mA]','[V]','[V]','[V]', '[V]', '[SLPM]','[#]','[#]', '[C]', '[C]','[C]', '[C]', '[C]') + ('[diam >nm]',)*len(LPC_DIAMS)
+
+# LPC CSV column formats: time, currents, voltages and flow, PWMs, temperatures, then the 32 high and low gain bins.
+LPC_CSV_FMT = ['%d']*4 + ['%.3f']*5 + ['%d']*2 + ['%.2f']*5 + ['%d']*32
+
+# Hardy (1998) saturation vapor pressure coefficients, for TK**-2 .. TK**4
+HARDY_COEFFS = np.array([-2.8365744e3,-6.028076559e3,1.954263612e1,-2.737830188e-2,1.6261698e-5,7.0229056e-10,-1.8680009e-13])
 
 def RS41_RH_wvmr(TC_ambient,hPa_ambient,rh_reported,TC_humSensor):
     '''
     Parameters: ambient:tempC,prshPa, RH_reported, tempC_of humSensor
     Returns: ambient RH and ambient water vapor mixing ratio ppmv
     '''
-    eswhPa_humSensor_temp=Hardy_1998(TC_humSensor)
-    eswhPa_ambient_temp=Hardy_1998(TC_ambient)
+    # Both temperatures go through a single Hardy_1998 call; broadcast first, as either may be a scalar
+    TC_humSensor,TC_ambient=np.broadcast_arrays(TC_humSensor,TC_ambient)
+    eswhPa_humSensor_temp,eswhPa_ambient_temp=Hardy_1998(np.stack((TC_humSensor,TC_ambient)))
     ew_hPa=eswhPa_humSensor_temp*rh_reported/100.
     RH_ambient=ew_hPa/eswhPa_ambient_temp*100
     WV_ppmv=WV_mixing_ratio(ew_hPa,hPa_ambient)
@@ -38,20 +69,28 @@ def WV_mixing_ratio(ew_hPa,prshPa):
 def Hardy_1998(TC):
    '''
    Returns saturation vapor pressure in hPa esw_hPa at TC from Hardy (1998)
-   Parameters Temp C
+   Parameters Temp C (scalar or numpy array)
    This is the formulation used by Vaisala the maker of the RS41
    '''
-   HC=[-2.8365744e3,-6.028076559e3,1.954263612e1,-2.737830188e-2,1.6261698e-5,7.0229056e-10,-1.8680009e-13]
    TK=TC+273.15
-   i=0
-   lesw=0
-   for c in HC:
-       lesw=lesw+c*TK**(i-2)
-       i=i+1
+   invTK=1.0/TK
+   # Horner form of sum(HARDY_COEFFS[i]*TK**(i-2))
+   lesw=(HARDY_COEFFS[0]*invTK+HARDY_COEFFS[1])*invTK+HARDY_COEFFS[2] \
+       +TK*(HARDY_COEFFS[3]+TK*(HARDY_COEFFS[4]+TK*(HARDY_COEFFS[5]+TK*HARDY_COEFFS[6])))
    lesw=lesw+2.7150305*np.log(TK)
    esw_hPa=np.exp(lesw)/100
    return esw_hPa
 
+def _tm_field(tm_xml:ET.Element, tag:str)->str:
+    '''
+    Return the stripped text of one element of the TM XML header ('' if it is empty),
+    or None if it is missing.
+
+    ElementTree is used rather than xmltodict, as only a few fields are needed.
+    '''
+    element = tm_xml.find(tag)
+    return None if element is None else (element.text or '').strip()
+
 class TMmsg:
     def __init__(self, msg_filename:str):
         '''
@@ -73,18 +112,22 @@ class TMmsg:
             data = binary_file.read()
 
         self.data = data
+        # Locate the XML sections once, each search starting where the previous one ended
+        self.tm_span = self.delimitedSpan(b'<TM>', b'</TM>')
+        self.crc_span = self.delimitedSpan(b'<CRC>', b'</CRC>', self.tm_span[1])
+        # The TM header is parsed once, here, and shared by binaryData and the subclasses
+        self._tm_xml = ET.fromstring(self.tm())
         self.bindata = self.binaryData()        
         self.unix_end_time = self.timeStamp()
         date_time = datetime.fromtimestamp(int(self.unix_end_time),tz=timezone.utc)
         self.formatted_time = date_time.strftime("%m/%d/%Y, %H:%M:%S")
 
-
     def tm(self):
         '''Return the TM'''
-        return self.delimitedText(b'<TM>', b'</TM>')
+        return self.spanText(self.tm_span)
     
     def parse_TM_xml(self)->str:
-        xml_txt = self.delimitedText(b'<TM>', b'</TM>')
+        xml_txt = self.spanText(self.tm_span)
         return xmltodict.parse(xml_txt)
 
     def parse_CRC_xml(self)->str:
@@ -97,16 +140,46 @@ class TMmsg:
         Raises:
             KeyError: If the start or end text is not found in the input data.
         '''        
-        xml_txt = self.delimitedText(b'<CRC>', b'</CRC>')
+        xml_txt = self.spanText(self.crc_span)
         return xmltodict.parse(xml_txt)
 
-    def delimitedText(self, startTxt:str, endTxt:str)->str:
+    def delimitedSpan(self, startTxt:bytes, endTxt:bytes, start:int=0)->tuple:
+        '''
+        Locate text delimited by start and end markers in the binary input.
+
+        Args:
+            startTxt (bytes): The start marker for the delimited text.
+            endTxt (bytes): The end marker for the delimited text.
+            start (int): The offset to start searching from.
+
+        Returns:
+            tuple: The (start, end) offsets of the text, including both markers.
+
+        Raises:
+            ValueError: If the start or end markers are not found in the input data.
+        '''
+        start = self.data.find(startTxt, start)
+        if start < 0:
+            raise ValueError(f'{startTxt!r} not found')
+        end = self.data.find(endTxt, start)
+        if end < 0:
+            raise ValueError(f'{endTxt!r} not found')
+        return start, end+len(endTxt)
+
+    def spanText(self, span:tuple)->str:
+        '''
+        Decode the text at the (start, end) offsets returned by delimitedSpan.
+        '''
+        return self.data[span[0]:span[1]].decode()
+
+    def delimitedText(self, startTxt:bytes, endTxt:bytes, start:int=0)->str:
         '''
         Extract and decode text delimited by start and end markers from the binary input.
 
         Args:
-            startTxt (str): The start marker for the delimited text.
-            endTxt (str): The end marker for the delimited text.
+            startTxt (bytes): The start marker for the delimited text.
+            endTxt (bytes): The end marker for the delimited text.
+            start (int): The offset to start searching from.
 
         Returns:
             bytes: Decoded text between the start and end markers.
@@ -114,9 +187,7 @@ class TMmsg:
         Raises:
             ValueError: If the start or end markers are not found in the input data.
         '''
-        start = self.data.find(startTxt)
-        end = self.data.find(endTxt)
-        return self.data[start:end+len(endTxt)].decode()
+        return self.spanText(self.delimitedSpan(startTxt, endTxt, start))
 
     def binaryData(self)->bytes:
         '''
@@ -126,11 +197,17 @@ class TMmsg:
             bytes: The extracted binary data segment.
 
         Raises:
-            KeyError: If the 'TM' or 'Length' keys are not found in the parsed XML data.
+            KeyError: If the 'Length' element is not found in the TM XML data.
+            ValueError: If '</CRC>' is not followed by '\nSTART'.
         '''
-        tm_xml = self.parse_TM_xml()
-        bin_length = int(tm_xml['TM']['Length'])
-        bin_start = self.data.find(b'</CRC>\nSTART') + 12
+        bin_length = _tm_field(self._tm_xml, 'Length')
+        if bin_length is None:
+            raise KeyError('Length')
+        bin_length = int(bin_length)
+        # The binary data follows '</CRC>\nSTART'
+        bin_start = self.crc_span[1] + len(b'\nSTART')
+        if self.data[self.crc_span[1]:bin_start] != b'\nSTART':
+            raise ValueError("'</CRC>' is not followed by '\\nSTART'")
         return self.data[bin_start:bin_start+bin_length]
 
     def timeStamp(self)->int:
@@ -141,9 +218,44 @@ class TMmsg:
             int: The extracted timestamp value.
 
         Raises:
-            struct.error: If there is an issue with unpacking the timestamp from the binary data.
+            struct.error: If the binary data is too short to hold the timestamp.
         '''
-        return  struct.unpack_from('>L', self.bindata, 0)[0]
+        if len(self.bindata) < 4:
+            raise struct.error('binary data too short for the timestamp')
+        return int.from_bytes(self.bindata[0:4], 'big')
+
+    def csvText(self)->list:
+        '''
+        Generate CSV text lines from the records.
+
+        The CSV methods rely on the instrument subclass providing _writeCsv(out_file).
+
+        Returns:
+            list: List of CSV text lines.
+        '''
+        csv_io = io.StringIO()
+        self._writeCsv(csv_io)
+        return csv_io.getvalue().split('\n')
+
+    def printCsv(self, out_file=None)->None:
+        '''
+        Print the CSV text lines generated from the records.
+
+        Args:
+            out_file: The text stream to print to. Defaults to sys.stdout.
+        '''
+        self._writeCsv(out_file or sys.stdout)
+
+    def saveCsv(self, out_filename:str)->None:
+        '''
+        Write the CSV text lines generated from the records to a file.
+
+        Args:
+            out_filename: The CSV file name.
+        '''
+        # 1 MiB write buffer; newline='' so the '\n' line endings are written as is on all platforms
+        with open(out_filename, "w", buffering=1<<20, newline='') as out_file:
+            self._writeCsv(out_file)
 
 class RS41msg(TMmsg):
     # The binary payload for the RS41 contains a couple of
@@ -157,9 +269,15 @@ class RS41msg(TMmsg):
     #    uint32_t frame;
     #    uint16_t tdry; (tdry+100)*100
     #    uint16_t humidity; (humdity*100)
-    #    uint16_t pres; (pres*100)
+    #    uint16_t tsens; (tsens+100)*100
+    #    uint16_t pres; (pres*50)
     #    uint16_t error;
     #};
+
+    # The decoded column arrays, which are also the keys of the records dictionaries
+    record_keys = ('valid', 'secs_from_start', 'air_temp_degC', 'humdity_percent', 'humidity_sensor_temp_degC',
+                   'pres_mb', 'module_error', 'rs41_rh_percent', 'wv_mixing_ratio_ppmv', 'unix_time')
+
     def __init__(self, msg_filename:str):
         '''
         Initialize the object with the provided binary data.
@@ -171,21 +289,28 @@ class RS41msg(TMmsg):
             None
         '''
         super().__init__(msg_filename)
-        self.records = self.allRS41samples()
+        self._records = None
+        self.allRS41samples()
 
-    def csvText(self)->list:
+    @property
+    def records(self)->list:
         '''
-        Generate CSV text lines from the records.
+        List of dictionaries containing decoded real-world values for each data sample.
+        It is built from the column arrays the first time it is used.
+        '''
+        if self._records is None:
+            columns = [getattr(self, key).tolist() for key in self.record_keys]
+            self._records = [dict(zip(self.record_keys, values)) for values in zip(*columns)]
+        return self._records
 
-        Returns:
-            list: List of CSV text lines.
+    def _writeCsv(self, out_file)->None:
+        '''
+        Write the CSV header with csv.writer, and the records with np.savetxt.
 
         Args:
-            self: The instance containing records and a CSV header.
+            out_file: The text stream to write to.
         '''
-
-        csv_io = io.StringIO()
-        csv_writer = csv.writer(csv_io, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        csv_writer = csv.writer(out_file, lineterminator='\n')
 
         csv_header = ['Instrument:', 'RS41', 'Measurement End Time:', self.formatted_time, 
                    'NCAR RS41 sensor on Strateole 2 Super Pressure Balloons']
@@ -195,76 +320,66 @@ class RS41msg(TMmsg):
             module_error,rs41_rh_percent,wv_mixing_ratio_ppmv'.replace(' ','').split(',')
         csv_writer.writerow(csv_header)
 
-        for r in self.records:
-            csv_line = [r['valid'], r['unix_time'], r['air_temp_degC'], r['humdity_percent'],
-                        r['humidity_sensor_temp_degC'], r['pres_mb'], r['module_error'],
-                        r['rs41_rh_percent'],r['wv_mixing_ratio_ppmv']]
-            csv_writer.writerow(csv_line)
-
-        return csv_io.getvalue().split('\r\n')
-
-    def printCsv(self):
-        '''
-        Prints the CSV text lines generated from the records.
-
-        Args:
-            self: The instance containing the CSV text lines to print.
-            
-        Returns:
-            None
-        '''
-
-        for r in self.csvText():
-            print(r)
-    
-    def saveCsv(self, out_filename:str)->None:
-        with open(out_filename, "w") as out_file:
-            for r in self.csvText():
-                out_file.write(r)
-                out_file.write('\n')
+        columns = (self.valid, self.unix_time, self.air_temp_degC, self.humdity_percent,
+                   self.humidity_sensor_temp_degC, self.pres_mb, self.module_error,
+                   self.rs41_rh_percent, self.wv_mixing_ratio_ppmv)
+        np.savetxt(out_file, np.column_stack(columns), fmt=RS41_CSV_FMT, delimiter=',')
 
     def decodeRS41sample(self, record)->dict:
         '''
-        Decode a binary sample and convert it to real-world values.
+        Decode a single binary sample and convert it to real-world values.
+
+        allRS41samples decodes all the samples at once; this is kept for
+        callers that work on one record at a time.
 
         Args:
-            record: The binary sample to decode.
+            record: The binary sample to decode, RS41_SAMPLE_DTYPE.itemsize bytes.
 
         Returns:
             dict: Decoded real-world values of the binary sample.
         '''
+        s = np.frombuffer(record, dtype=RS41_SAMPLE_DTYPE, count=1)[0]
         r = {}
-        r['valid'] = struct.unpack_from('B', record, 0)[0]
-        r['secs_from_start'] = struct.unpack_from('>l', record, 1)[0]
-        # print('decodeRS41',self.unix_end_time,r['unix_time'])
-        r['air_temp_degC'] = struct.unpack_from('>H', record, 5)[0]/100.0-100.0
-        r['humdity_percent'] = struct.unpack_from('>H', record, 7)[0]/100.0
-        r['humidity_sensor_temp_degC'] = struct.unpack_from('>H', record, 9)[0]/100.0-100.0
-        r['pres_mb'] = struct.unpack_from('>H', record, 11)[0]/50.0
-        r['module_error'] = struct.unpack_from('>H', record, 13)[0]
-        r['rs41_rh_percent'],r['wv_mixing_ratio_ppmv']=RS41_RH_wvmr(r['air_temp_degC'],r['pres_mb'],r['humdity_percent'],r['humidity_sensor_temp_degC'])
-        #print(r)
+        r['valid'] = int(s['valid'])
+        r['secs_from_start'] = int(s['frame'])
+        r['air_temp_degC'] = (int(s['tdry']) - 10000) / 100.0
+        r['humdity_percent'] = int(s['hum']) / 100.0
+        r['humidity_sensor_temp_degC'] = (int(s['tsens']) - 10000) / 100.0
+        r['pres_mb'] = int(s['pres']) / 50.0
+        r['module_error'] = int(s['err'])
+        rh, wv = RS41_RH_wvmr(r['air_temp_degC'], r['pres_mb'], r['humdity_percent'], r['humidity_sensor_temp_degC'])
+        r['rs41_rh_percent'], r['wv_mixing_ratio_ppmv'] = float(rh), float(wv)
         return r
-    
-    def allRS41samples(self)->list:
+
+    def allRS41samples(self)->None:
         '''
         Go through all data samples and convert them to real-world values.
 
+        The records are decoded in one pass with np.frombuffer, and the
+        conversions are done on whole columns. Each field is stored as a
+        column array attribute, named as in record_keys.
+
         Returns:
-            list: List of dictionaries containing decoded real-world values for each data sample.
+            None
         '''
-        record_len = 1 + 4 + 2 + 2 + 2 + 2 + 2
-        records = []
-        for i in range(6, len(self.bindata)-6, record_len):
-            record = self.bindata[i:i+record_len]
-            records.append(self.decodeRS41sample(record))
+        n_samples = (len(self.bindata) - 6) // RS41_SAMPLE_DTYPE.itemsize
+        samples = np.frombuffer(self.bindata, dtype=RS41_SAMPLE_DTYPE, count=n_samples, offset=6)
 
-        # Compute the unix time for each sample
-        start_time = self.unix_end_time - (records[-1]['secs_from_start'] - records[0]['secs_from_start'] + 1)
-        for i in range(len(records)):
-            records[i]['unix_time'] =  records[i]['secs_from_start'] + start_time
+        self.valid = samples['valid'].astype(np.uint8)
+        self.secs_from_start = samples['frame'].astype(np.int32)
+        self.module_error = samples['err'].astype(np.uint16)
 
-        return records
+        # The offsets are removed before scaling, so each value is rounded once
+        self.air_temp_degC = (samples['tdry'] - 10000.0) / 100.0
+        self.humdity_percent = samples['hum'] / 100.0
+        self.humidity_sensor_temp_degC = (samples['tsens'] - 10000.0) / 100.0
+        self.pres_mb = samples['pres'] / 50.0
+        self.rs41_rh_percent, self.wv_mixing_ratio_ppmv = RS41_RH_wvmr(self.air_temp_degC, self.pres_mb,
+                                                                       self.humdity_percent, self.humidity_sensor_temp_degC)
+
+        # Compute the unix time for each sample, in int64 so that it cannot overflow the int32 frame counts
+        start_time = self.unix_end_time - (int(self.secs_from_start[-1]) - int(self.secs_from_start[0]) + 1)
+        self.unix_time = self.secs_from_start.astype(np.int64) + start_time
 
 class LPCmsg(TMmsg):
     def __init__(self, msg_filename:str):
@@ -279,9 +394,7 @@ class LPCmsg(TMmsg):
         '''
         super().__init__(msg_filename)
 
-        #LPC bins - each number is the left end of the bins in nm.   The first bin has minimal sensitivity
-        diams = [275,300,325,350,375,400,450,500,550,600,650,700,750,800,900,1000,1200,1400,1600,1800,2000,2500,3000,3500,4000,6000,8000,10000,13000,16000,24000,24000]
-        self.bin_header = list(map(str, diams))
+        self.bin_header = LPC_BIN_HEADER
 
         # Initialize some metadata
         self.sn = 'Unknown'
@@ -289,14 +402,14 @@ class LPCmsg(TMmsg):
         self.lon= ''
         self.alt = ''
 
-        tm_xml = self.parse_TM_xml()
-
-        self.instrument = 'Unknown'
-        if 'Inst' in tm_xml['TM']:
-            self.inst = tm_xml['TM']['Inst']
+        self.inst = 'Unknown'
+        inst = _tm_field(self._tm_xml, 'Inst')
+        if inst:
+            self.inst = inst
 
-        if 'StateMess3' in tm_xml['TM']:
-            tokens = tm_xml['TM']['StateMess3'].split(',')
+        state_mess3 = _tm_field(self._tm_xml, 'StateMess3')
+        if state_mess3 is not None:
+            tokens = state_mess3.split(',')
             if len(tokens) == 3:
                 self.lat = tokens[0]
                 self.lon = tokens[1]
@@ -304,60 +417,42 @@ class LPCmsg(TMmsg):
         self.unpackBinary()
 
     def unpackBinary(self):
-        records = int(len(self.bindata)/96) -2
-        self.HGBins = np.zeros(shape=(16,records))
-        self.LGBins = np.zeros(shape=(16,records))
-        self.HKData = np.zeros(shape=(16,records))
-        for y in range(records):
-          
-            self.HKRaw = []
-           
-            indx = 36 + (y+1)*96
-        
-            for x in range(16):
-                self.HGBins[x,y] = struct.unpack_from('>H',self.bindata,indx + x*2)[0]    
-                self.LGBins[x,y] = struct.unpack_from('>H',self.bindata,indx + x*2 + 32)[0]
-                self.HKRaw.append(struct.unpack_from('>H',self.bindata,indx + x*2 + 64)[0])
-            
-
-            #modified to agree with the current LPC HK scheme - this will need to be updated for mission 
-            self.HKData[0,y] = self.HKRaw[0] + self.unix_end_time #elapsed time since the start of the measurement in seconds
-            self.HKData[1,y] = self.HKRaw[1]  # Pump1 Current in mA
-            self.HKData[2,y] = self.HKRaw[2]  # Pump2 Current in mA
-            self.HKData[3,y] = self.HKRaw[3]  # Detector Current in mA
-            
-            self.HKData[4,y] = self.HKRaw[4] / 1000.0 # Detector voltage in V
-            self.HKData[5,y] = self.HKRaw[5] / 1000.0 # PHA Voltage in volts
-            self.HKData[6,y] = self.HKRaw[6] / 1000.0 # Tennsy V in volts
-            self.HKData[7,y] = self.HKRaw[7] / 1000.0 # VBattery V 
-            self.HKData[8,y] = self.HKRaw[8] / 1000.0 # Flow in LPM
-            self.HKData[9,y] = self.HKRaw[9] # Pump1 PWM drive signal (0 - 1023)
-            self.HKData[10,y] = self.HKRaw[10] # Pump2 PWM drive signal (0 - 1023)
-            self.HKData[11,y] = self.HKRaw[11] / 100.0 - 273.15 # Pump1 T in C
-            self.HKData[12,y] = self.HKRaw[12] / 100.0 - 273.15 # Pump2 T in C
-            self.HKData[13,y] = self.HKRaw[13] / 100.0 - 273.15 # Laser T in C
-            self.HKData[14,y] = self.HKRaw[14] / 100.0 - 273.15 # Board T in C
-            self.HKData[15,y] = self.HKRaw[15] / 100.0 - 273.15 # Inlet T in C
-    def csvText(self)->list:
         '''
-        Generate CSV text lines from the records.
+        Decode the binary data records into the high gain bins, low gain bins
+        and housekeeping data arrays, each with one column per record, and
+        the combined rowData array with one row per record.
 
-        Returns:
-            list: List of CSV text lines.
+        Each record is laid out as LPC_RECORD_DTYPE. All records are read with one
+        np.frombuffer call, giving a (records, 48) array.
+        '''
+        records = len(self.bindata)//LPC_RECORD_DTYPE.itemsize - 2
+        raw = np.frombuffer(self.bindata, dtype=LPC_RECORD_DTYPE, count=records, offset=36+LPC_RECORD_DTYPE.itemsize)
+
+        # One row per record, in CSV column order. HKData, HGBins and LGBins are views into it.
+        self.rowData = np.empty(shape=(records, 48))
+        self.HKData = self.rowData[:, 0:16].T
+        self.HGBins = self.rowData[:, 16:32].T
+        self.LGBins = self.rowData[:, 32:48].T
+        self.HKData[:] = raw[:, 32:48].T
+        self.HGBins[:] = raw[:, 0:16].T
+        self.LGBins[:] = raw[:, 16:32].T
+
+        #modified to agree with the current LPC HK scheme - this will need to be updated for mission 
+        self.HKData[0] += self.unix_end_time # elapsed time since the start of the measurement in seconds
+        # HKData[1:4]: Pump1, Pump2 and Detector Current in mA
+        self.HKData[4:9] /= 1000.0 # Detector voltage, PHA Voltage, Tennsy V, VBattery V in volts; Flow in LPM
+        # HKData[9:11]: Pump1 and Pump2 PWM drive signal (0 - 1023)
+        self.HKData[11:16] = self.HKData[11:16] / 100.0 - 273.15 # Pump1, Pump2, Laser, Board and Inlet T in C
+
+    def _writeCsv(self, out_file)->None:
+        '''
+        Write the CSV headers with csv.writer, and the records with np.savetxt.
 
         Args:
-            self: The instance containing records and a CSV header.
+            out_file: The text stream to write to.
         '''
+        csv_writer = csv.writer(out_file, lineterminator='\n')
 
-        csv_io = io.StringIO()
-        csv_writer = csv.writer(csv_io, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-        #LPC bins - each number is the left end of the bins in nm.   The first bin has minimal sensitivity
-        diams = [275,300,325,350,375,400,450,500,550,600,650,700,750,800,900,1000,1200,1400,1600,1800,2000,2500,3000,3500,4000,6000,8000,10000,13000,16000,24000,24000]
-        bin_header = list(map(str,diams))
-
-        csv_writer = csv.writer(csv_io, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        
         header1 = ['Instrument:', self.inst, 'Measurement End Time:', self.formatted_time, 
                    'LASP Optical Particle Counter on Strateole 2 Super Pressure Balloons']
         csv_writer.writerow(header1)
@@ -366,36 +461,10 @@ class LPCmsg(TMmsg):
                    'Altitude [m]:',self.alt]
         csv_writer.writerow(header2)
 
-        header3 = ['Time', 'Pump1_I','Pump2_I','PHA_I', 'PHA_12V','PHA_3V3','CPU_V', 'Input_V', 'Flow', 
-                   'Pump1_PWM', 'Pump2_PWM','Pump1_T', 'Pump2_T', 'Laser_T', 'PCB_T', 'Inlet_T'] + bin_header
-        csv_writer.writerow(header3)
-
-        header4 = ['[unix_time]', '[mA]','[mA]','[mA]','[V]','[V]','[V]', '[V]', '[SLPM]','[#]','[#]', '[C]', '[C]','[C]', '[C]', '[C]'] + ['[diam >nm]']*len(bin_header)
-        csv_writer.writerow(header4)
-
-        for row in range(len(self.HKData[0,:])):
-            csv_writer.writerow(self.HKData[:,row].tolist() + self.HGBins[:,row].tolist() +self.LGBins[:,row].tolist())
-
-        return csv_io.getvalue().split('\r\n')
-
-    def printCsv(self):
-        '''
-        Prints the CSV text lines generated from the records.
+        csv_writer.writerow(LPC_CSV_HEADER)
+        csv_writer.writerow(LPC_CSV_UNITS)
 
-        Args:
-            self: The instance containing the CSV text lines to print.
-            
-        Returns:
-            None
-        '''
-        for r in self.csvText():
-            print(r)
-    
-    def saveCsv(self, out_filename:str)->None:
-        with open(out_filename, "w") as out_file:
-            for r in self.csvText():
-                out_file.write(r)
-                out_file.write('\n')
+        np.savetxt(out_file, self.rowData, fmt=LPC_CSV_FMT, delimiter=',')
 
 def argParse():
     '''
@@ -444,11 +513,30 @@ def argParse():
     return args
 
 def determine_msg_type(filename:str)->str:
+    '''
+    Determine the message type from the StateMess2 field of the TM header,
+    which is 'RS41' for RS41 messages.
+
+    Only the start of the file is read, since the header comes first. The full
+    message is decoded only if StateMess2 is not found there.
+
+    Returns:
+        str: 'rs41' or 'lpc'
+    '''
     msg_type = 'lpc'
 
+    with open(filename, 'rb') as tm_file:
+        head = tm_file.read(4096)
+    start = head.find(b'<StateMess2>')
+    end = head.find(b'</StateMess2>', start)
+    if start >= 0 and end >= 0:
+        if head[start+len(b'<StateMess2>'):end].strip() == b'RS41':
+            msg_type = 'rs41'
+        return msg_type
+
     msg = TMmsg(filename)
-    tm = msg.parse_TM_xml()
-    if 'StateMess2' in tm['TM'] and tm['TM']['StateMess2'] == 'RS41':
+    state_mess2 = _tm_field(msg._tm_xml, 'StateMess2')
+    if state_mess2 == 'RS41':
         msg_type = 'rs41'
 
     return msg_type
@@ -458,36 +546,60 @@ def get_files(ext:str):
     csv_files = [f.replace(ext, '.csv') for f in tm_files]
     return tm_files, csv_files
 
-if __name__ == "__main__":
+def _process_one(tm_file:str, csv_file:str, args, out_file=None)->str:
+    '''
+    Decode one TM file, print it and optionally save it as CSV.
 
-    args = argParse()
+    Args:
+        tm_file: The TM message file name.
+        csv_file: The CSV file name, or None.
+        args: The parsed command line arguments.
+        out_file: Where to print to. If None, the printed text is collected and returned,
+                  so that the output of parallel workers can be printed in order.
 
-    if args.batch:
-        tm_files, csv_files = get_files(args.filename_or_ext)
-    else:
-        tm_files = [args.filename_or_ext]
-        csv_files = [args.csv]
+    Returns:
+        str: The collected text, or '' if out_file was given.
+    '''
+    collect = out_file is None
+    if collect:
+        out_file = io.StringIO()
+
+    try:
+        if args.msg_type:
+            msg_type = args.msg_type
+        else:
+            msg_type = determine_msg_type(tm_file)
 
-    for tm_file, csv_file in zip(tm_files, csv_files):
+        if msg_type == 'lpc':
+            msg = LPCmsg(tm_file)
+        if msg_type == 'rs41':
+            msg = RS41msg(tm_file)
 
-        try:
-            if args.msg_type:
-                msg_type = args.msg_type
-            else:
-                msg_type = determine_msg_type(tm_file)
+        if args.tm:
+            print(msg.tm(), file=out_file)
 
-            if msg_type == 'lpc':
-                msg = LPCmsg(tm_file)
-            if msg_type == 'rs41':
-                msg = RS41msg(tm_file)
+        if not args.quiet:
+            msg.printCsv(out_file)
 
-            if args.tm:
-                print(msg.tm())
+        if csv_file:
+            msg.saveCsv(csv_file)
+    except (struct.error, ValueError):
+        # np.frombuffer raises ValueError when the binary data is short
+        print(f'*** Error decoding binary data in {tm_file}, file was not processed', file=out_file)
 
-            if not args.quiet:
-                msg.printCsv()
+    return out_file.getvalue() if collect else ''
 
-            if csv_file:
-                msg.saveCsv(csv_file)
-        except struct.error:
-            print(f'*** Error decoding binary data in {tm_file}, file was not processed')
+if __name__ == "__main__":
+
+    args = argParse()
+
+    if args.batch:
+        # Each file is independent, so decode them in parallel
+        tm_files, csv_files = get_files(args.filename_or_ext)
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(tm_files)//(4*workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for text in executor.map(_process_one, tm_files, csv_files, itertools.repeat(args), chunksize=chunksize):
+                print(text, end='')
+    else:
+        _process_one(args.filename_or_ext, args.csv, args, sys.stdout)